@@ -8,6 +8,7 @@ def main():
         name='sysfstree',
         packages=['sysfstree'],
         package_dir={'': 'src'},
+        package_data={'sysfstree': ['profiles.json']},
         version=open('VERSION.txt').read().strip(),
         author='Stuart Lynne',
         author_email='stuart.lynne@gmail.com',
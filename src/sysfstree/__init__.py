@@ -19,33 +19,70 @@ import os
 import sys
 import argparse
 
+# the daemon is only imported for --serve so that the --socket client stays thin,
+# sysfstree only imports python-magic when pathread() needs it
+#
 try:
-	from sysfstree.sysfstree import sysfstree
+	from sysfstree.sysfstree import sysfstree, ORDERS
+	from sysfstree.client import sysfsclient
+	from sysfstree.profiles import loadprofiles, plan, mergedtree
 except (ImportError):
-	from sysfstree import sysfstree
+	from sysfstree import sysfstree, ORDERS
+	from client import sysfsclient
+	from profiles import loadprofiles, plan, mergedtree
 
 
-def _main(paths, maxlevel=-1, pinclude=[], pexclude=[], include=[], exclude=[], bold=[], sort=True):
+def _main(paths, maxlevel=-1, pinclude=[], pexclude=[], include=[], exclude=[], bold=[],
+		sort=True, order=None, client=None, **limits):
 	# print("_main: bold: %s" % (bold))
 	#print("pinclude: %s" % (pinclude))
 	#print("pexclude: %s" % (pexclude))
 	#print("paths: %s" % (paths), file=sys.stderr)
 	#print("include: %s" % (include), file=sys.stderr)
 	#print("exclude: %s" % (exclude), file=sys.stderr)
+	if client is not None:
+		for l in client.tree(paths, maxlevel=maxlevel,
+				pinclude=pinclude, pexclude=pexclude,
+				include=include, exclude=exclude,
+				bold=bold, sort=sort, order=order, **limits):
+			print("%s" % (l), file=sys.stdout)
+		return
 	for p in paths:
 		sysfs = sysfstree(p, maxlevel=maxlevel,
 				pinclude=pinclude, pexclude=pexclude,
 			include=include, exclude=exclude,
-			bold=bold, sort=sort)
+			bold=bold, sort=sort, order=order, **limits)
 		for l in sysfs._tree(p, os.listdir(p), "", -1):
 			print("%s" % (l), file=sys.stdout)
 
 
+def _merged(root, walks, maxlevel=-1, order=None, client=None, **limits):
+	if client is not None:
+		for l in client.tree([root], maxlevel=maxlevel, order=order, walks=walks, **limits):
+			print("%s" % (l), file=sys.stdout)
+		return
+	sysfs = mergedtree(root, walks, maxlevel=maxlevel, order=order, **limits)
+	try:
+		for l in sysfs._tree(root, os.listdir(root), "", -1):
+			print("%s" % (l), file=sys.stdout)
+	except OSError as e:
+		print("[%s] [%s]" % (root, type(e).__name__))
+
+
 def _test(args):
 	_main(["/sys/kernel/config/usb_gadget"])
 
 
 def main():
+	# find any profile files before building the parser so that their flags can be added
+	preparser = argparse.ArgumentParser(add_help=False)
+	preparser.add_argument("--profile", action='append', default=[])
+	(preargs, _) = preparser.parse_known_args()
+
+	profiles = loadprofiles()
+	for path in preargs.profile:
+		loadprofiles(path, profiles)
+
 	parser = argparse.ArgumentParser(
 		description="Display information about Gadget USB from SysFS and ConfigFS",
 		formatter_class=lambda prog: argparse.RawTextHelpFormatter(prog, width=999))
@@ -56,27 +93,23 @@ def main():
 
 	parser.add_argument("--test", help=argparse.SUPPRESS, action='store_true')
 
-	config = parser.add_argument_group('Gadget Configuration')
-	config.add_argument("--usb-gadget", "--gadget", help="/sys/kernel/config/usb_gadget", action='store_true')
-	config.add_argument("--usb-gadget-udc", "--gadget-udc", help="/sys/kernel/config/usb_gadget/*/udc", action='store_true')
-
-	modules = parser.add_argument_group('Gadget Modules')
-	modules.add_argument("--usb_f", "--usbf",
-		help="/lib/modules/$(uname --kernel-release)/kernel/drivers/usb/gadget/function/usb_f*",
-		action='store_true')
-
-	status = parser.add_argument_group('Status')
-	status.add_argument("--udc", help="/sys/class/udc", action='store_true')
-	status.add_argument("--soc-udc", help="/sys/devices/platform/soc/*.usb/udc", action='store_true')
-	status.add_argument("--soc-udc-state", help="/sys/devices/platform/soc/*.usb/udc/state", action='store_true')
-	status.add_argument("--soc-gadget", help="/sys/devices/platform/soc/*.usb/gadget", action='store_true')
-	status.add_argument("--soc-usb3", help="/sys/devices/platform/soc/*.usb/usb3", action='store_true')
-	status.add_argument("--modules", help="/sys/modules/", action='store_true')
-
-	pi = parser.add_argument_group('Raspberry Pi')
-	pi.add_argument("--pi",
-		help="Raspberry Pi info from /proc/device-tree/",
-		action='store_true')
+	# shortcut flags are defined by the profiles, add them to the group named by each profile
+	groups = dict((title, parser.add_argument_group(title))
+		for title in ['Gadget Configuration', 'Gadget Modules', 'Status', 'Raspberry Pi'])
+	for name, profile in profiles.items():
+		if 'flags' not in profile:
+			continue
+		title = profile.get('group', 'Profiles')
+		if title not in groups:
+			groups[title] = parser.add_argument_group(title)
+		groups[title].add_argument(*profile['flags'], dest=name, help=profile.get('help', name), action='store_true')
+
+	if 'Profiles' not in groups:
+		groups['Profiles'] = parser.add_argument_group('Profiles')
+	prof = groups['Profiles']
+	prof.add_argument("--profile", metavar='FILE', action='append',
+		help="load profiles from FILE (json or yaml), may be repeated", default=[])
+	prof.add_argument("--use", metavar='PROFILE', action='append', help="use PROFILE, may be repeated", default=[])
 
 	# usb = parser.add_argument_group('UDC')
 	# usb.add_argument("--gadget", help="/sys/kernel/config/usb_gadget", action='store_true')
@@ -85,6 +118,15 @@ def main():
 	misc.add_argument("-r", "--root", help="root of file tree", default=".")
 	misc.add_argument("-o", "--output", help="output file name", default="")
 	misc.add_argument("-m", "--maxlevel", help="max level", type=int, default=-1)
+	misc.add_argument("--order", help="directory order", choices=ORDERS, default=None)
+	misc.add_argument("--maxentries", help="max entries shown per directory", type=int, default=-1)
+	misc.add_argument("--maxnodes", help="max entries shown per walk", type=int, default=-1)
+	misc.add_argument("--maxbytes", help="max bytes of file data read per walk", type=int, default=-1)
+	misc.add_argument("--maxtime", help="max seconds per walk", type=float, default=-1)
+
+	daemon = parser.add_argument_group('Daemon')
+	daemon.add_argument("--serve", metavar='SOCKET', help="run as a daemon listening on SOCKET")
+	daemon.add_argument("--socket", metavar='SOCKET', help="send requests to the daemon listening on SOCKET")
 
 	# parser.add_argument("paths", metavar='Path', type=str, nargs="*", help="pathname", default=[])
 	parser.add_argument("paths", metavar='Path', type=str, nargs=argparse.REMAINDER, help="pathname", default=[])
@@ -92,59 +134,28 @@ def main():
 	args = parser.parse_args()
 	#print("args: %s" % (args), file=sys.stderr)
 
-	if args.test:
-		_test(args)
-
-	if args.usb_gadget:
-		_main(["/sys/kernel/config/usb_gadget"], maxlevel=args.maxlevel)
-
-	if args.usb_gadget_udc:
-		_main(["/sys/kernel/config/usb_gadget/"], maxlevel=args.maxlevel,
-				include=[[], ["UDC"]],
-				bold=[[], ["UDC"]])
-
-	if args.udc:
-		for s in os.listdir("/sys/class/udc"):
-			# print("udc: s: %s" % (s, ), file=sys.stderr)
-			_main([os.path.realpath("/sys/class/udc/%s" % (s))], maxlevel=args.maxlevel)
-
-	if args.soc_udc_state:
-		_main(["/sys/devices/platform/soc"], maxlevel=args.maxlevel,
-			include=["*.usb", ["udc"], [], ["state", "function"]],
-			bold=[["*"], [], ["*"], ["state", "function"]])
-		_main(["/sys/kernel/config/usb_gadget/"], maxlevel=args.maxlevel,
-			include=[[], ["UDC", "id*", "functions", "strings"]],
-			bold=[["*"], ["UDC", "id*", ], ["*.*"], ["manufacturer", "product"]])
-		_main(["/sys//kernel/config/usb_gadget/"], maxlevel=args.maxlevel,
-			include=[[], ["configs"]],)
+	if args.serve:
+		try:
+			from sysfstree.daemon import serve
+		except (ImportError):
+			from daemon import serve
+		serve(args.serve)
+		return
 
-	if args.udc or args.soc_udc:
-		_main(["/sys/devices/platform/"], maxlevel=args.maxlevel,
-		pinclude=["ocp/*.usb/*/*.usb", "soc/*.usb/*/*.usb"],
-		bold=[["*"], [], ["*"], ["state"]])
+	client = sysfsclient(args.socket) if args.socket else None
+	limits = dict(maxentries=args.maxentries, maxnodes=args.maxnodes, maxbytes=args.maxbytes, maxtime=args.maxtime)
 
-	if args.soc_gadget:
-		_main(["/sys/devices/platform/soc"], maxlevel=args.maxlevel, include=["*.usb", ["gadget"], args.include])
-
-	if args.soc_usb3:
-		_main(["/sys/devices/platform/soc"], maxlevel=args.maxlevel, include=["*.usb", ["usb3", "gadget"]])
-
-	if args.modules:
-		_main(["/sys/module"], maxlevel=args.maxlevel,
-			include=[["usb_f_*", "dwc2", "dwc_otg", "libcomposite", "udc_core", "usbcore"], ["holders", "initstate"]])
-
-	if args.usb_f:
-		(sysname, nodename, release, version, machine) = os.uname()
-		path = "/lib/modules/" + release + "/kernel/drivers/usb/gadget/function/"
-		_main([path], maxlevel=args.maxlevel, include=["usb_f_*"])
-
-	if args.pi:
-		_main(["/proc/device-tree"], maxlevel=args.maxlevel, include=["model", "serial-number"])
+	if args.test:
+		_test(args)
 
-	# - /sys/module/usbf_f*
+	# merge all of the selected profiles into a single walk per root
+	names = [name for name in profiles if getattr(args, name, False)] + args.use
+	for root, walks in plan(profiles, names, include=args.include):
+		_merged(root, walks, maxlevel=args.maxlevel, order=args.order, client=client, **limits)
 
 	for path in args.path + args.paths:
-		_main([path], maxlevel=args.maxlevel, pinclude=args.include, pexclude=args.exclude)
+		_main([path], maxlevel=args.maxlevel, order=args.order, client=client,
+			pinclude=args.include, pexclude=args.exclude, **limits)
 
 
 if __name__ == "__main__":
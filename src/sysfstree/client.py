@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# vim: syntax=python noexpandtab
+
+# sysfsclient sends requests to a sysfstree daemon (see daemon.py) listening on a Unix
+# domain socket, one JSON object per line in each direction.
+#
+# The client only needs json and socket so that sysfstree --socket does not pay for
+# importing the walker.
+#
+# e.g.
+#   client = sysfsclient('/tmp/sysfstree.sock')
+#   for l in client.tree(['/sys/class/udc'], maxlevel=2):
+#       print(l)
+#
+
+import json
+import socket
+
+"""client.py: ..."""
+
+# __author__  = "Stuart.Lynne@belcarra.com"
+
+
+class sysfsclient(object):
+
+	def __init__(self, sockpath):
+		self.sockpath = sockpath
+		self.sock = None
+		self.rfile = None
+
+	def _connect(self):
+		if self.sock is None:
+			self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self.sock.connect(self.sockpath)
+			self.rfile = self.sock.makefile('rb')
+
+	def close(self):
+		if self.sock is not None:
+			self.rfile.close()
+			self.sock.close()
+			self.sock = None
+
+	def request(self, request):
+		self._connect()
+		self.sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+		line = self.rfile.readline()
+		if not line:
+			self.close()
+			raise ConnectionError('sysfsclient: %s closed connection' % (self.sockpath))
+		response = json.loads(line.decode('utf-8'))
+		if not response['ok']:
+			raise RuntimeError('sysfsclient: %s' % (response['error']))
+		return response['result']
+
+	def tree(self, paths, **kwargs):
+		return self.request(dict(kwargs, op='tree', paths=paths))
+
+	def snapshot(self, paths, **kwargs):
+		return self.request(dict(kwargs, op='snapshot', paths=paths))
+
+	def poll(self, paths, **kwargs):
+		return self.request(dict(kwargs, op='poll', paths=paths))
+
+	def drop(self, paths, **kwargs):
+		return self.request(dict(kwargs, op='drop', paths=paths))
+
+	def query(self, path, **kwargs):
+		return self.request(dict(kwargs, op='query', path=path))
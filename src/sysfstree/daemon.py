@@ -0,0 +1,354 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# vim: syntax=python noexpandtab
+
+# sysfstree daemon implements a long running server listening on a Unix domain socket.
+#
+# Short lived sysfstree processes pay for interpreter startup, imports and cold reads on
+# every call. The daemon keeps warm sysfstree walkers (with their include/exclude/bold
+# filters) and answers requests from a thin client. Identical requests that arrive while
+# a walk is already in progress are coalesced and share the result of that single walk.
+#
+# The protocol is one JSON object per line in each direction:
+#
+#   {"op": "tree", "paths": ["/sys/class/udc"], "maxlevel": 2}
+#   {"ok": true, "result": ["[/sys/class/udc]", ...]}
+#
+# Supported ops:
+#   ping        - returns "pong"
+#   tree        - returns the list of lines that _tree() would print for each path
+#   snapshot    - returns {"files": {path: data}, "truncated": [...]} with the data for each
+#                 file found as read by pathread() and what was not read because of the
+#                 maxentries, maxnodes, maxbytes and maxtime limits, with "decode": true
+#                 the data is decoded to int, bool, str or a list of int (see decode.py)
+#   poll        - snapshot the paths and add the decoded values to a series kept by the
+#                 daemon, returns {"values": {path: value}, "deltas": {path: delta},
+#                 "truncated": [...]} with the new or changed values and the changes
+#                 to numeric values since the previous identical poll request, only the
+#                 last two snapshots are kept
+#   drop        - drop the series kept for an identical poll request, returns true if
+#                 there was one
+#   query       - returns the data for a single file ("path")
+#
+# Requests are sent with sysfsclient (see client.py).
+#
+# tree and snapshot requests may carry a list of "walks" for a single root as returned
+# by profiles.plan() instead of include/exclude/bold filters.
+#
+# The daemon keeps a warm walker for each of the last MAXWALKERS (64) distinct roots and
+# walker parameters used, the least recently used walker is dropped, query requests do
+# not keep a walker.
+#
+# e.g.
+#   sysfstree --serve /tmp/sysfstree.sock &
+#   sysfstree --socket /tmp/sysfstree.sock --gadget
+#
+
+import os
+import sys
+import json
+import stat
+import socket
+import collections
+import socketserver
+import threading
+
+try:
+	from sysfstree.sysfstree import sysfstree, ORDERS
+	from sysfstree.profiles import mergedtree, FILTERS
+	from sysfstree.decode import decode, sysfsseries
+except (ImportError):
+	from sysfstree import sysfstree, ORDERS
+	from profiles import mergedtree, FILTERS
+	from decode import decode, sysfsseries
+
+"""daemon.py: ..."""
+
+# __author__  = "Stuart.Lynne@belcarra.com"
+
+
+# number of warm walkers kept
+#
+MAXWALKERS = 64
+
+# walker parameters accepted in a request, with their defaults
+#
+WALKARGS = {
+	'maxlevel': -1,
+	'pinclude': [],
+	'pexclude': [],
+	'include': [],
+	'exclude': [],
+	'bold': [],
+	'ordinary': False,
+	'nobold': False,
+	'sort': True,
+	'order': None,
+	'maxentries': -1,
+	'maxnodes': -1,
+	'maxbytes': -1,
+	'maxtime': -1,
+	'followsyms': False,
+}
+
+
+# convert data returned by pathread() or decode() into something that can be sent
+# as JSON, binary data is sent as a hex string
+#
+def _jsondata(data):
+	if type(data) is bytes:
+		return data.hex()
+	if type(data) is list:
+		return [(d.rstrip() if type(d) is str else d) for d in data]
+	return data
+
+
+# _filters
+# Return the filters with every filter that is missing or null set to [], raise
+# ValueError if filters is not an object
+#
+def _filters(filters):
+	if type(filters) is not dict:
+		raise ValueError('walks must be a list of objects')
+	return dict((k, filters.get(k) or []) for k in FILTERS)
+
+
+# _checkargs
+# Raise ValueError for walker parameters that sysfstree() would reject with exit()
+#
+def _checkargs(kwargs, walks=None):
+	if kwargs.get('order') is not None and kwargs['order'] not in ORDERS:
+		raise ValueError('order must be one of %s' % (', '.join(ORDERS)))
+	for filters in [kwargs] + (walks or []):
+		if len(filters.get('pinclude', [])) > 0 and len(filters.get('include', [])) > 0:
+			raise ValueError('pinclude and include mutually exclusive')
+		if len(filters.get('pexclude', [])) > 0 and len(filters.get('exclude', [])) > 0:
+			raise ValueError('pexclude and exclude mutually exclusive')
+
+
+class _pending(object):
+
+	def __init__(self):
+		self.event = threading.Event()
+		self.result = None
+		self.error = None
+
+
+class sysfsdaemon(object):
+
+	def __init__(self, sockpath):
+		self.sockpath = sockpath
+		self.walkers = collections.OrderedDict()
+		self.inflight = {}
+		self.series = {}
+		self.lock = threading.Lock()
+		self.server = None
+		self.inode = None
+
+	# _walker
+	# Return a warm sysfstree instance for the root and walker parameters in the request,
+	# if the request has a list of walks (see profiles.plan()) a mergedtree is used,
+	# the walker lock is held while it is in use, only the MAXWALKERS most recently
+	# used walkers are kept
+	#
+	def _walker(self, root, request):
+		kwargs = dict((k, request.get(k, v)) for k, v in WALKARGS.items())
+		kwargs.update(_filters(kwargs))
+		walks = request.get('walks')
+		if walks is not None:
+			if type(walks) is not list:
+				raise ValueError('walks must be a list of objects')
+			walks = [_filters(walk) for walk in walks]
+		key = json.dumps([root, kwargs, walks], sort_keys=True)
+		with self.lock:
+			walker = self.walkers.get(key)
+			if walker is None:
+				_checkargs(kwargs, walks)
+				if walks is None:
+					walker = sysfstree(root, **kwargs)
+				else:
+					for k in FILTERS:
+						del kwargs[k]
+					walker = mergedtree(root, walks, **kwargs)
+				walker.lock = threading.Lock()
+				self.walkers[key] = walker
+				while len(self.walkers) > MAXWALKERS:
+					self.walkers.popitem(last=False)
+			else:
+				self.walkers.move_to_end(key)
+		return walker
+
+	def _tree(self, request):
+		lines = []
+		for p in request.get('paths', []):
+			walker = self._walker(p, request)
+			with walker.lock:
+				try:
+					lines += list(walker._tree(p, os.listdir(p), "", -1))
+				except PermissionError:
+					lines.append("[%s] [PermissionError]" % (p))
+		return lines
+
+	# _files
+	# Return the (path, data) tuples as read by pathread() for the paths in the request
+	# and what was not read because of the walk limits
+	#
+	def _files(self, request):
+		files = []
+		truncated = []
+		for p in request.get('paths', []):
+			walker = self._walker(p, request)
+			with walker.lock:
+				files += list(walker._snapshot(p, os.listdir(p), -1))
+				truncated += walker.truncated
+		return (files, truncated)
+
+	def _snapshot(self, request):
+		(files, truncated) = self._files(request)
+		files = dict((path, _jsondata(decode(data) if request.get('decode', False) else data)) for path, data in files)
+		return {'files': files, 'truncated': truncated}
+
+	# _poll
+	# The series decodes the data as read, the decoded values are only converted
+	# for JSON in the response
+	#
+	def _poll(self, request):
+		(files, truncated) = self._files(request)
+		key = json.dumps(dict(request, op='poll'), sort_keys=True)
+		with self.lock:
+			series = self.series.get(key)
+			if series is None:
+				series = self.series[key] = sysfsseries(maxrows=2)
+		series.append(files)
+		values = dict((path, _jsondata(value)) for path, value in series.lastvalues().items())
+		deltas = dict((path, _jsondata(delta)) for path, delta in series.lastdeltas().items())
+		return {'values': values, 'deltas': deltas, 'truncated': truncated}
+
+	def _drop(self, request):
+		key = json.dumps(dict(request, op='poll'), sort_keys=True)
+		with self.lock:
+			return self.series.pop(key, None) is not None
+
+	# _query
+	# pathread() keeps no per walk state so a walker is not kept for queries
+	#
+	def _query(self, request):
+		path = request['path']
+		walker = sysfstree(os.path.dirname(path), -1, include=[], exclude=[], ordinary=request.get('ordinary', False))
+		data = walker.pathread(path)
+		return _jsondata(decode(data) if request.get('decode', False) else data)
+
+	def _run(self, request):
+		op = request.get('op')
+		if op == 'ping':
+			return 'pong'
+		if op == 'tree':
+			return self._tree(request)
+		if op == 'snapshot':
+			return self._snapshot(request)
+		if op == 'query':
+			return self._query(request)
+		if op == 'poll':
+			return self._poll(request)
+		if op == 'drop':
+			return self._drop(request)
+		raise ValueError('unknown op: %s' % (op))
+
+	# handle
+	# Run the request, or if an identical request is already running wait
+	# for it and share its result
+	#
+	def handle(self, request):
+		key = json.dumps(request, sort_keys=True)
+		with self.lock:
+			pending = self.inflight.get(key)
+			owner = pending is None
+			if owner:
+				pending = self.inflight[key] = _pending()
+
+		if owner:
+			try:
+				pending.result = self._run(request)
+			except Exception as e:
+				pending.error = '%s: %s' % (type(e).__name__, e)
+			finally:
+				with self.lock:
+					del self.inflight[key]
+				pending.event.set()
+		else:
+			pending.event.wait()
+
+		if pending.error is not None:
+			return {'ok': False, 'error': pending.error}
+		return {'ok': True, 'result': pending.result}
+
+	# _removestale
+	# Remove a socket left behind by a daemon that is no longer running, raise OSError
+	# if sockpath is not a socket or if another daemon is listening on it
+	#
+	def _removestale(self):
+		try:
+			mode = os.lstat(self.sockpath).st_mode
+		except FileNotFoundError:
+			return
+		if not stat.S_ISSOCK(mode):
+			raise OSError('%s exists and is not a socket' % (self.sockpath))
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			sock.connect(self.sockpath)
+		except ConnectionRefusedError:
+			os.unlink(self.sockpath)
+			return
+		finally:
+			sock.close()
+		raise OSError('%s is in use by another daemon' % (self.sockpath))
+
+	# _removeown
+	# Remove the socket if it is still the one this daemon created
+	#
+	def _removeown(self):
+		try:
+			st = os.lstat(self.sockpath)
+		except FileNotFoundError:
+			return
+		if stat.S_ISSOCK(st.st_mode) and st.st_ino == self.inode:
+			os.unlink(self.sockpath)
+
+	def serve_forever(self):
+		daemon = self
+
+		class handler(socketserver.StreamRequestHandler):
+			def handle(self):
+				for line in self.rfile:
+					try:
+						response = daemon.handle(json.loads(line.decode('utf-8')))
+					except ValueError as e:
+						response = {'ok': False, 'error': 'ValueError: %s' % (e)}
+					self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+					self.wfile.flush()
+
+		self._removestale()
+		self.server = socketserver.ThreadingUnixStreamServer(self.sockpath, handler)
+		self.server.daemon_threads = True
+		self.inode = os.lstat(self.sockpath).st_ino
+		try:
+			self.server.serve_forever()
+		finally:
+			self.server.server_close()
+			self._removeown()
+
+	def shutdown(self):
+		if self.server is not None:
+			self.server.shutdown()
+
+
+def serve(sockpath):
+	daemon = sysfsdaemon(sockpath)
+	print("sysfstree: listening on %s" % (sockpath), file=sys.stderr)
+	try:
+		daemon.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	except OSError as e:
+		print("sysfstree: %s" % (e), file=sys.stderr)
+		exit(1)
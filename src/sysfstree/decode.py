@@ -0,0 +1,324 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# vim: syntax=python noexpandtab
+
+# decode implements optional typed decoding of the data read from sysfs files and
+# compact storage of the decoded values across many snapshots.
+#
+# decode() converts the data returned by sysfstree.pathread() for single line files:
+#
+#   0, -1, 12345        - int
+#   0x1d6b              - int
+#   Y, N, true, false,
+#   enabled, disabled   - bool
+#   1 2 3, 0x1 0x2      - list of int (vector)
+#   auto, not attached,
+#   0104                - str (enum), numbers with leading zeros are kept as text
+#
+# anything else (multi-line files, binary data) is returned unchanged.
+#
+# sysfsseries keeps one column per file path across many snapshots, each column is
+# backed by an array: int and vector values as 64 bit integers, bool values as bytes
+# and enum values as codes into a per column list of labels. Repeated polling can then
+# be reported as small numeric deltas rather than text. With maxrows only the last
+# maxrows snapshots are kept.
+#
+# e.g.
+#   series = sysfsseries(maxrows=100)
+#   sysfs = sysfstree(root, maxlevel=-1)
+#   series.append(sysfs._snapshot(root, os.listdir(root), -1))
+#   ...
+#   series.append(sysfs._snapshot(root, os.listdir(root), -1))
+#   print(series.lastdeltas())
+#
+
+import re
+import time
+from array import array
+
+"""decode.py: ..."""
+
+# __author__  = "Stuart.Lynne@belcarra.com"
+
+
+BOOLEANS = {
+	'Y': True, 'N': False,
+	'true': True, 'false': False,
+	'enabled': True, 'disabled': False,
+}
+
+_INT = re.compile(r'-?(0|[1-9][0-9]*)$')
+_HEX = re.compile(r'0[xX][0-9a-fA-F]+$')
+
+
+# _number
+# Return token as an int or None
+#
+def _number(token):
+	if _INT.match(token):
+		return int(token)
+	if _HEX.match(token):
+		return int(token, 16)
+	return None
+
+
+# decode
+# Return the typed value of data as returned by pathread(), values that have
+# already been decoded are returned unchanged
+#
+def decode(data):
+	"""
+	>>> decode(['12345\\n'])
+	12345
+	>>> decode(['0x1d6b\\n'])
+	7531
+	>>> decode(['0104\\n'])
+	'0104'
+	>>> decode(['Y\\n'])
+	True
+	>>> decode(['1 2 3\\n'])
+	[1, 2, 3]
+	>>> decode(['not attached\\n'])
+	'not attached'
+	>>> decode(['a\\n', 'b\\n'])
+	['a\\n', 'b\\n']
+	>>> decode(b'\\x01\\x04')
+	b'\\x01\\x04'
+	"""
+	if type(data) is list:
+		if len(data) == 0:
+			return ''
+		if len(data) != 1 or type(data[0]) is not str:
+			return data
+		text = data[0].strip()
+	elif type(data) is str:
+		text = data.strip()
+	else:
+		return data
+
+	if text in BOOLEANS:
+		return BOOLEANS[text]
+	number = _number(text)
+	if number is not None:
+		return number
+	tokens = text.split()
+	if len(tokens) > 1:
+		numbers = [_number(t) for t in tokens]
+		if None not in numbers:
+			return numbers
+	return text
+
+
+# _kind
+# Return the column kind for a decoded value
+#
+def _kind(value):
+	if type(value) is bool:
+		return 'bool'
+	if type(value) is int:
+		return 'int'
+	if type(value) is str:
+		return 'enum'
+	if type(value) is list and len(value) > 0 and all(type(v) is int for v in value):
+		return 'vector'
+	return 'object'
+
+
+class _column(object):
+
+	def __init__(self, value):
+		self.kind = _kind(value)
+		self.width = len(value) if self.kind == 'vector' else 1
+		self.rows = array('L')
+		self.labels = []
+		self.codes = {}
+		self.counts = array('L')
+		self.unused = 0
+		self.data = {
+			'bool': lambda: array('b'),
+			'int': lambda: array('q'),
+			'vector': lambda: array('q'),
+			'enum': lambda: array('L'),
+			'object': lambda: [],
+		}[self.kind]()
+
+	def __len__(self):
+		return len(self.rows)
+
+	# _demote
+	# Convert to an object column when a value does not fit
+	#
+	def _demote(self):
+		self.data = self.values()
+		self.kind = 'object'
+		self.labels = []
+		self.codes = {}
+		self.counts = array('L')
+		self.unused = 0
+
+	def _append(self, value):
+		if self.kind == 'enum':
+			code = self.codes.get(value)
+			if code is None:
+				code = self.codes[value] = len(self.labels)
+				self.labels.append(value)
+				self.counts.append(0)
+			elif self.counts[code] == 0:
+				self.unused -= 1
+			self.counts[code] += 1
+			self.data.append(code)
+		elif self.kind == 'vector':
+			self.data.extend(array('q', value))
+		else:
+			self.data.append(value)
+
+	def append(self, row, value):
+		if self.kind != 'object':
+			if _kind(value) != self.kind or (self.kind == 'vector' and len(value) != self.width):
+				self._demote()
+		try:
+			self._append(value)
+		except OverflowError:
+			self._demote()
+			self._append(value)
+		self.rows.append(row)
+
+	# value
+	# Return the i'th value stored
+	#
+	def value(self, i):
+		if i < 0:
+			i += len(self.rows)
+		if self.kind == 'bool':
+			return bool(self.data[i])
+		if self.kind == 'enum':
+			return self.labels[self.data[i]]
+		if self.kind == 'vector':
+			return list(self.data[i * self.width:(i + 1) * self.width])
+		return self.data[i]
+
+	def values(self):
+		return [self.value(i) for i in range(len(self.rows))]
+
+	# trim
+	# Remove the values stored for rows before first, enum codes are kept and the
+	# labels are only compacted once there are more unused labels than used ones
+	#
+	def trim(self, first):
+		n = 0
+		while n < len(self.rows) and self.rows[n] < first:
+			n += 1
+		if n == 0:
+			return
+		if self.kind == 'enum':
+			for code in self.data[:n]:
+				self.counts[code] -= 1
+				if self.counts[code] == 0:
+					self.unused += 1
+		del self.rows[:n]
+		del self.data[:n * self.width if self.kind == 'vector' else n]
+		if self.kind == 'enum' and self.unused > len(self.labels) - self.unused:
+			self._compact()
+
+	# _compact
+	# Remove the enum labels that are no longer used and renumber the codes
+	#
+	def _compact(self):
+		remap = array('L', [0] * len(self.labels))
+		labels = []
+		counts = array('L')
+		for code, label in enumerate(self.labels):
+			if self.counts[code] == 0:
+				continue
+			remap[code] = len(labels)
+			labels.append(label)
+			counts.append(self.counts[code])
+		self.labels = labels
+		self.codes = dict((label, code) for code, label in enumerate(labels))
+		self.counts = counts
+		self.unused = 0
+		self.data = array('L', (remap[code] for code in self.data))
+
+
+class sysfsseries(object):
+
+	def __init__(self, maxrows=-1):
+		self.maxrows = maxrows
+		self.first = 0
+		self.times = array('d')
+		self.columns = {}
+
+	# append
+	# Decode and add a snapshot, either a dict or (path, data) tuples as yielded
+	# by sysfstree._snapshot(), return the snapshot row number, row numbers keep
+	# counting up when older snapshots are removed because of maxrows
+	#
+	def append(self, snapshot, when=None):
+		row = self.first + len(self.times)
+		self.times.append(time.time() if when is None else when)
+		if type(snapshot) is dict:
+			snapshot = snapshot.items()
+		for path, data in snapshot:
+			value = decode(data)
+			column = self.columns.get(path)
+			if column is None:
+				column = self.columns[path] = _column(value)
+			column.append(row, value)
+		if self.maxrows != -1 and len(self.times) > self.maxrows:
+			self._trim(len(self.times) - self.maxrows)
+		return row
+
+	# _trim
+	# Remove the oldest n snapshots, columns with no values left are removed
+	#
+	def _trim(self, n):
+		del self.times[:n]
+		self.first += n
+		for path in list(self.columns):
+			column = self.columns[path]
+			column.trim(self.first)
+			if len(column) == 0:
+				del self.columns[path]
+
+	# _last
+	# Yield (path, column, previous) for the columns in the last snapshot, previous
+	# is False if the column was not in the snapshot before that
+	#
+	def _last(self):
+		row = self.first + len(self.times) - 1
+		for path, column in self.columns.items():
+			if len(column) == 0 or column.rows[-1] != row:
+				continue
+			yield (path, column, len(column) > 1 and column.rows[-2] == row - 1)
+
+	# lastvalues
+	# Return {path: value} for the values in the last snapshot that are new,
+	# or that changed and are not int or vector
+	#
+	def lastvalues(self):
+		result = {}
+		for path, column, previous in self._last():
+			value = column.value(-1)
+			if not previous:
+				result[path] = value
+			elif column.kind not in ('int', 'vector') and value != column.value(-2):
+				result[path] = value
+		return result
+
+	# lastdeltas
+	# Return {path: delta} for the non-zero changes to int and vector values in the last snapshot
+	#
+	def lastdeltas(self):
+		result = {}
+		for path, column, previous in self._last():
+			if not previous:
+				continue
+			if column.kind == 'int':
+				delta = column.value(-1) - column.value(-2)
+				if delta != 0:
+					result[path] = delta
+			elif column.kind == 'vector':
+				delta = [b - a for a, b in zip(column.value(-2), column.value(-1))]
+				if any(delta):
+					result[path] = delta
+		return result
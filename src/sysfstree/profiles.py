@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# vim: syntax=python noexpandtab
+
+# profiles implements declarative shortcut profiles and a planner that merges them.
+#
+# A profile file (JSON, or YAML if PyYAML is installed) maps a profile name to:
+#
+#   group       - argparse group for the command line flags
+#   flags       - command line flags that select the profile, e.g. ["--usb-gadget", "--gadget"]
+#   help        - help text for the flags
+#   walks       - list of walks, each a root and the usual sysfstree filters
+#                 (include, exclude, pinclude, pexclude, bold)
+#
+# Roots may contain shell patterns which are expanded with glob, "realpath": true resolves
+# each expanded root and {release} is replaced with the running kernel release. An "@include"
+# level in include is replaced with the -I/--include list from the command line.
+#
+# plan() merges the walks of all of the selected profiles into a single walk per distinct
+# root. The mergedtree walker shows an entry if any of the walks for that root would have
+# shown it, so selecting several profiles never walks the same root more than once.
+#
+# The default profiles are in profiles.json alongside this file.
+#
+
+import os
+import sys
+import glob
+import json
+import collections
+
+try:
+	from sysfstree.sysfstree import sysfstree
+except (ImportError):
+	from sysfstree import sysfstree
+
+"""profiles.py: ..."""
+
+# __author__  = "Stuart.Lynne@belcarra.com"
+
+
+DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles.json')
+
+FILTERS = ['include', 'exclude', 'pinclude', 'pexclude', 'bold']
+
+
+# loadprofiles
+# Load the profiles from path and add them to profiles, later files override
+# earlier profiles with the same name, profiles are kept in the order they are
+# found so that the command line flags and walks keep the file order
+#
+def loadprofiles(path=DEFAULT, profiles=None):
+	if profiles is None:
+		profiles = collections.OrderedDict()
+	with open(path) as f:
+		if path.endswith('.yaml') or path.endswith('.yml'):
+			# PyYAML is only imported when it is needed
+			try:
+				import yaml
+			except (ImportError):
+				print('sysfstree: PyYAML required to load %s' % (path), file=sys.stderr)
+				exit(1)
+			profiles.update(yaml.safe_load(f))
+		else:
+			profiles.update(json.load(f, object_pairs_hook=collections.OrderedDict))
+	return profiles
+
+
+# _roots
+# Return the list of roots for a walk
+#
+def _roots(walk):
+	(sysname, nodename, release, version, machine) = os.uname()
+	root = walk['root'].format(release=release)
+	if any(c in root for c in '*?['):
+		roots = sorted(glob.glob(root))
+	else:
+		roots = [root]
+	if walk.get('realpath', False):
+		roots = [os.path.realpath(r) for r in roots]
+	return [os.path.normpath(r) for r in roots]
+
+
+# _filters
+# Return the filters for a walk with "@include" levels replaced by include
+#
+def _filters(walk, include):
+	filters = dict((k, walk.get(k, [])) for k in FILTERS)
+	filters['include'] = [(include if level == '@include' else level) for level in filters['include']]
+	return filters
+
+
+# plan
+# Return a list of (root, walks) for the selected profiles with one entry
+# for each distinct root, in the order that the roots are first seen
+#
+def plan(profiles, names, include=[]):
+	roots = collections.OrderedDict()
+	for name in names:
+		if name not in profiles:
+			print('sysfstree: unknown profile: %s' % (name), file=sys.stderr)
+			exit(1)
+		for walk in profiles[name]['walks']:
+			filters = _filters(walk, include)
+			for root in _roots(walk):
+				walks = roots.setdefault(root, [])
+				if filters not in walks:
+					walks.append(filters)
+	return list(roots.items())
+
+
+class mergedtree(sysfstree):
+
+	def __init__(self, root, walks, maxlevel, **kwargs):
+		sysfstree.__init__(self, root, maxlevel, include=[], exclude=[], **kwargs)
+		self.walks = [sysfstree(root, maxlevel, **dict(walk, **kwargs)) for walk in walks]
+		self.last = (None, None, [])
+
+	# _walks
+	# Return the walks that match every component of path down to level, path is
+	# the path through any followed symlinks so it is always below root
+	#
+	def _walks(self, path, level):
+		if self.last[0] == path and self.last[1] == level:
+			return self.last[2]
+		names = os.path.relpath(path, self.root).split(os.sep)
+		walks = self.walks
+		for l, name in enumerate(names[:level + 1]):
+			p = os.path.join(self.root, *names[:l + 1])
+			walks = [w for w in walks if w.match(p, name, l)]
+		self.last = (path, level, walks)
+		return walks
+
+	def match(self, path, name, level):
+		return len(self._walks(path, level)) > 0
+
+	def _color(self, path, level, full_path=None):
+		for w in self._walks(full_path, level):
+			text = w._color(path, level)
+			if text != path:
+				return text
+		return path
@@ -30,9 +30,10 @@
 # loosely adapted from FileTreeMaker.py
 
 import os
+import re
 import sys
+import time
 import fnmatch
-import magic
 import struct
 from termcolor import colored
 
@@ -44,10 +45,58 @@ from termcolor import colored
 # __author__  = "Stuart.Lynne@belcarra.com"
 
 
+# directory entry ordering, see sysfstree._order()
+#
+#   native      - the order returned by readdir, no sorting, entries are streamed as they are read
+#   name        - case insensitive name
+#   natural     - case insensitive name with numbers compared by value, cpu2 before cpu10
+#   inode       - inode number, typically creation order in sysfs
+#
+ORDERS = ['native', 'name', 'natural', 'inode']
+
+
+# _natural
+# Return a sort key that compares runs of digits by value
+#
+def _natural(name):
+	return [int(t) if t.isdigit() else t.casefold() for t in re.split(r'(\d+)', name)]
+
+
+# _scandir
+# Yield the names in path as they are read
+#
+def _scandir(path):
+	it = os.scandir(path)
+	try:
+		for d in it:
+			yield d.name
+	finally:
+		# close() and the context manager are Python 3.6, before that the
+		# iterator is closed when it is exhausted or garbage collected
+		if hasattr(it, 'close'):
+			it.close()
+
+
+# _lookahead
+# Yield (item, last) for each item, last is True for the final item
+#
+def _lookahead(iterable):
+	it = iter(iterable)
+	try:
+		prev = next(it)
+	except StopIteration:
+		return
+	for item in it:
+		yield (prev, False)
+		prev = item
+	yield (prev, True)
+
+
 class sysfstree(object):
 
 	def __init__(self, root, maxlevel, pinclude=[], pexclude=[], include=None, exclude=None,
-			bold=None, ordinary=False, nobold=False, sort=True, followsyms=False):
+			bold=None, ordinary=False, nobold=False, sort=True, followsyms=False, order=None,
+			maxentries=-1, maxnodes=-1, maxbytes=-1, maxtime=-1):
 
 		self.maxlevel = maxlevel
 		self.include = include
@@ -59,6 +108,25 @@ class sysfstree(object):
 		self.root = root
 		self.sort = sort
 
+		# sort is retained for compatibility, order takes precedence
+		if order is None:
+			order = ('native', 'name')[sort]
+		if order not in ORDERS:
+			print('sysfstree: order must be one of %s' % (', '.join(ORDERS)))
+			exit(1)
+		self.order = order
+
+		# limits, -1 is unlimited, see _budget()
+		#   maxentries  - entries shown per directory
+		#   maxnodes    - entries shown per walk
+		#   maxbytes    - bytes of file data read per walk
+		#   maxtime     - seconds per walk
+		self.maxentries = maxentries
+		self.maxnodes = maxnodes
+		self.maxbytes = maxbytes
+		self.maxtime = maxtime
+		self._reset()
+
 		self.pinclude = [x.split('/') for x in pinclude]
 		self.pexclude = [x.split('/') for x in pexclude]
 
@@ -179,12 +247,22 @@ class sysfstree(object):
 		# print("match_pinclude: NO MATCH %s" % (name), file=sys.stderr)
 		return False
 
+	# match
+	# Return True if name matches the includes and does not match the excludes for this level
+	#
+	def match(self, path, name, level):
+		if not (self.match_pinclude(path, name, level) or self.match_include(name, level)):
+			return False
+		if self.match_exclude(name, level) or self.match_pexclude(path, name, level):
+			return False
+		return True
+
 	def _colored(self, text, color=None, attrs=None):
 		if self.nobold:
 			return text
 		return colored(text, color, attrs=attrs)
 
-	def _color(self, path, level):
+	def _color(self, path, level, full_path=None):
 		if self.bold is None:
 			return path
 		try:
@@ -208,6 +286,107 @@ class sysfstree(object):
 				return self._colored(path, 'red', attrs=['bold'])
 		return path
 
+	# _reset
+	# Reset the per walk counters, truncated is the list of what was not shown
+	# during the last walk
+	#
+	def _reset(self):
+		self.nodes = 0
+		self.nbytes = 0
+		self.start = time.monotonic()
+		self.stopped = None
+		self.truncated = []
+
+	# _truncate
+	# Record something that was not shown
+	#
+	def _truncate(self, path, reason, skipped=None):
+		t = {'path': path, 'reason': reason, 'limit': getattr(self, reason)}
+		if skipped is not None:
+			t['skipped'] = skipped
+		self.truncated.append(t)
+
+	# _error
+	# Record a directory that could not be read
+	#
+	def _error(self, path, e):
+		self.truncated.append({'path': path, 'reason': 'error', 'error': '%s: %s' % (type(e).__name__, e)})
+
+	# _budget
+	# Return the name of the walk limit that has been reached, or None, the first time
+	# a limit is reached the walk is stopped, each level records what it did not show
+	# as the walk unwinds (see _stop())
+	#
+	def _budget(self, path):
+		if self.maxnodes != -1 and self.nodes >= self.maxnodes:
+			self.stopped = 'maxnodes'
+		elif self.maxbytes != -1 and self.nbytes >= self.maxbytes:
+			self.stopped = 'maxbytes'
+		elif self.maxtime != -1 and time.monotonic() - self.start >= self.maxtime:
+			self.stopped = 'maxtime'
+		else:
+			return None
+		return self.stopped
+
+	# _stop
+	# Record the entries in parent_path that are not shown because the walk was stopped,
+	# shown is the number of entries already shown and unshown the number left, return
+	# (remaining, overflow) where overflow is how many of them maxentries would have
+	# skipped anyway, they are recorded as maxentries
+	#
+	def _stop(self, parent_path, shown, unshown):
+		overflow = 0
+		if self.maxentries != -1:
+			overflow = max(0, shown + unshown - self.maxentries)
+		if unshown - overflow:
+			self._truncate(parent_path, self.stopped, unshown - overflow)
+		if overflow:
+			self._truncate(parent_path, 'maxentries', overflow)
+		return (unshown - overflow, overflow)
+
+	# _truncated
+	# Yield the lines shown at the end of a directory for the entries not shown because
+	# the walk was stopped (remaining) or because of maxentries (skipped)
+	#
+	def _truncated(self, prefix, remaining, skipped):
+		if remaining:
+			yield ("%s%s[truncated: %d more entries, %s %s reached]" %
+				(prefix, ("└──", "├──")[skipped > 0], remaining, self.stopped, getattr(self, self.stopped)))
+		if skipped:
+			yield ("%s└──[truncated: %d more entries, maxentries %d reached]" % (prefix, skipped, self.maxentries))
+
+	# _skipped
+	# Return the number of entries remaining that would have been shown, symlinks are
+	# not counted if links is False and they are not being followed
+	#
+	def _skipped(self, parent_path, names, level, links=True, logical_parent=None):
+		count = 0
+		for sub_path in names:
+			full_path = os.path.join(parent_path, sub_path)
+			if not self.match(os.path.join(logical_parent or parent_path, sub_path), sub_path, level):
+				continue
+			if not links and not self.followsyms and os.path.islink(full_path):
+				continue
+			count += 1
+		return count
+
+	# _order
+	# Return the names in path (or names if given) in the configured order,
+	# for native order this is a generator when names is not given
+	#
+	def _order(self, path, names=None):
+		if self.order == 'native':
+			return _scandir(path) if names is None else names
+		if self.order == 'inode':
+			if names is None:
+				return [d.name for d in sorted(os.scandir(path), key=lambda dirent: dirent.inode())]
+			return sorted(names, key=lambda name: os.lstat(os.path.join(path, name)).st_ino)
+		if names is None:
+			names = os.listdir(path)
+		if self.order == 'natural':
+			return sorted(names, key=_natural)
+		return sorted(names, key=str.casefold)
+
 	def pathdescriptors(self, path):
 		try:
 			# XXX need to stat the file and limit how much
@@ -240,6 +419,14 @@ class sysfstree(object):
 		except Exception:
 			return ''
 
+	# _size
+	# Return the number of bytes in data returned by pathread()
+	#
+	def _size(self, data):
+		if type(data) is list:
+			return sum(len(d) for d in data)
+		return len(data)
+
 	def pathread(self, path):
 
 		try:
@@ -275,8 +462,10 @@ class sysfstree(object):
 			return self.pathdescriptors(path)
 
 		# unknown - see if ELF module, this is special case
-		# so we can list modules from /lib/.*/modules/
+		# so we can list modules from /lib/.*/modules/, magic is slow to import
+		# so it is only imported here
 		#
+		import magic
 		try:
 			filetype = magic.from_file(path)
 			if "ELF" in filetype:
@@ -286,58 +475,81 @@ class sysfstree(object):
 		return '<UNKNOWN>'
 
 	# recurse through the file system displaying information from the files
-	# and symlinks found
+	# and symlinks found, logical_parent is parent_path as reached through any
+	# followed directory symlinks, entries are matched and colored using it
 	#
-	def _tree(self, parent_path, file_list, prefix, level):
+	def _tree(self, parent_path, file_list, prefix, level, logical_parent=None):
 
 		if level == -1:
+			self._reset()
 			yield ("[%s]" % (self._colored(parent_path, attrs=['bold'])))
-			yield from self._tree(parent_path, file_list, prefix, 0)
+			yield from self._tree(parent_path, self._order(parent_path, file_list), prefix, 0)
 			return
 
-		if len(file_list) == 0 or (self.maxlevel != -1 and self.maxlevel <= level):
+		if self.maxlevel != -1 and self.maxlevel <= level:
 			return
 
-		if self.sort:
-			file_list = sorted(file_list, key=str.casefold)
-
-		# first all of the files and symlinks, skip directories
-		for idx, sub_path in enumerate(file_list):
+		# first all of the files and symlinks, directories are saved for below,
+		# file_list may be a generator (see _order()) so it is only iterated once
+		if logical_parent is None:
+			logical_parent = parent_path
+		dirs = []
+		shown = 0
+		skipped = 0
+		entries = _lookahead(file_list)
+		for sub_path, last in entries:
 
 			full_path = os.path.join(parent_path, sub_path)
+			logical_path = os.path.join(logical_parent, sub_path)
 
-			# if there is a set of includes for this level ensure that the we match
-			# this path
-			if not (self.match_pinclude(full_path, sub_path, level) or self.match_include(sub_path, level)):
-				# print('%s FILE DID NOT MATCH INCLUDE' % (sub_path), file=sys.stderr)
+			# ensure that we match the includes and do not match the excludes for this level
+			if not self.match(logical_path, sub_path, level):
+				# print('%s FILE DID NOT MATCH' % (sub_path), file=sys.stderr)
 				continue
 
-			# if there is a set of excludes for this level ensure that the we do not
-			# match this path
-			if self.match_exclude(sub_path, level) or self.match_pexclude(full_path, sub_path, level):
-				# print('%s FILE DID MATCH EXCLUDE' % (sub_path), file=sys.stderr)
+			# if the per directory limit has been reached count what is left in this directory
+			if self.maxentries != -1 and shown >= self.maxentries:
+				skipped = 1 + self._skipped(parent_path, (s for s, l in entries), level, logical_parent=logical_parent)
+				self._truncate(parent_path, 'maxentries', skipped)
+				break
+
+			# stop if a walk limit has been reached, the saved directories, this entry
+			# and what is left in this directory are not shown
+			symlink = os.path.islink(full_path) and not self.followsyms
+			isdir = not symlink and not os.path.isfile(full_path)
+			if not isdir and self._budget(full_path) is not None:
+				unshown = len(dirs) + 1 + self._skipped(parent_path, (s for s, l in entries), level, logical_parent=logical_parent)
+				(remaining, skipped) = self._stop(parent_path, shown - len(dirs), unshown)
+				yield from self._truncated(prefix, remaining, skipped)
+				return
+			shown += 1
+
+			# save directories for below
+			if isdir:
+				if os.path.isdir(full_path) or os.path.islink(full_path):
+					dirs.append((sub_path, full_path, logical_path, last))
 				continue
+			self.nodes += 1
 
 			# set the tree decoration
-			# idc = ("┣━━", "┗━━")[idx == len(file_list) - 1]
-			idc = ("├──", "└──")[idx == len(file_list) - 1]
+			# idc = ("┣━━", "┗━━")[last]
+			idc = ("├──", "└──")[last]
 
 			# for symlinks yield the real pathname
-			if os.path.islink(full_path) and not self.followsyms:
-				yield ("%s%s%s -> %s" % (prefix, idc, self._color(sub_path, level), os.path.realpath(full_path)))
+			if symlink:
+				yield ("%s%s%s -> %s" % (prefix, idc, self._color(sub_path, level, logical_path), os.path.realpath(full_path)))
 				continue
 
 			# files yield as many lines of data as we read from the file, pathread() does
 			# some interpretation so it will recognize ELF files and USB Descriptors
 			#
-			if not os.path.isfile(full_path):
-				continue
 
 			data = self.pathread(full_path)
+			self.nbytes += self._size(data)
 			first = True
 			# test for empty file
 			if len(data) == 0:
-				yield ("%s%s%s: [NULL]" % (prefix, idc, self._color(sub_path, level)))
+				yield ("%s%s%s: [NULL]" % (prefix, idc, self._color(sub_path, level, logical_path)))
 				continue
 
 			idc = "├──"
@@ -353,7 +565,7 @@ class sysfstree(object):
 					if count < 16 and total < len(data):
 						continue
 
-					yield ("%s%s%s:%s" % (prefix, idc, self._color(sub_path, level), line))
+					yield ("%s%s%s:%s" % (prefix, idc, self._color(sub_path, level, logical_path), line))
 					count = 0
 					line = ''
 					if not first:
@@ -366,7 +578,7 @@ class sysfstree(object):
 
 			# normal text data
 			for d in data:
-				yield ("%s%s%s: %s" % (prefix, idc, self._color(sub_path, level), d.rstrip()))
+				yield ("%s%s%s: %s" % (prefix, idc, self._color(sub_path, level, logical_path), d.rstrip()))
 				if not first:
 					continue
 				# blank sub_path and change idc
@@ -374,50 +586,87 @@ class sysfstree(object):
 				idc = "│ "
 				first = False
 
-		# do directories
-		for idx, sub_path in enumerate(file_list):
+		# do directories, if the walk has stopped show what is left
+		for idx, (sub_path, full_path, logical_path, last) in enumerate(dirs):
 
-			full_path = os.path.join(parent_path, sub_path)
+			if self.stopped is not None or self._budget(full_path) is not None:
+				self._truncate(parent_path, self.stopped, len(dirs) - idx)
+				yield from self._truncated(prefix, len(dirs) - idx, skipped)
+				return
+			self.nodes += 1
 
-			# if there is a set of includes for this level ensure that the we match
-			# this path
-			if not self.match_pinclude(full_path, sub_path, level) and not self.match_include(sub_path, level):
-				# print('%s dir did not match include' % (sub_path), file=sys.stderr)
-				continue
+			# set the tree decoration
+			# idc = ("┣━━", "┗━━")[last]
+			idc = ("├──", "└──")[last]
 
-			# if there is a set of excludes for this level ensure that the we do not
-			# match this path
-			if self.match_exclude(sub_path, level) or self.match_pexclude(full_path, sub_path, level):
-				# print('%s dir did match exclude' % (sub_path), file=sys.stderr)
-				continue
+			# for directories yield the directory name and then yield from recursively
+			if os.path.islink(full_path):
+				yield ("%s%s[%s -> %s]" % (prefix, idc, self._color(sub_path, level, logical_path), os.path.realpath(full_path)))
+				full_path = os.path.realpath(full_path)
+			else:
+				yield ("%s%s[%s]" % (prefix, idc, self._color(sub_path, level, logical_path)))
 
-			# set the tree decoration
-			# idc = ("┣━━", "┗━━")[idx == len(file_list) - 1]
-			idc = ("├──", "└──")[idx == len(file_list) - 1]
+			tmp_prefix = (prefix + "    ", prefix + "│   ")[not last]
+			yield from self._tree(full_path, self._order(full_path), tmp_prefix, level + 1, logical_path)
+
+		yield from self._truncated(prefix, 0, skipped)
 
-			if not self.followsyms and os.path.islink(full_path):
+	# recurse through the file system like _tree() but yield (path, data) tuples
+	# for the files found instead of formatted lines, data is as returned by pathread(),
+	# anything not shown because of the limits is recorded in truncated
+	#
+	def _snapshot(self, parent_path, file_list, level, logical_parent=None):
+
+		if level == -1:
+			self._reset()
+			yield from self._snapshot(parent_path, file_list, 0)
+			return
+
+		if self.maxlevel != -1 and self.maxlevel <= level:
+			return
+
+		if logical_parent is None:
+			logical_parent = parent_path
+		shown = 0
+		entries = iter(file_list)
+		for sub_path in entries:
+
+			full_path = os.path.join(parent_path, sub_path)
+			logical_path = os.path.join(logical_parent, sub_path)
+
+			if not self.match(logical_path, sub_path, level):
+				continue
+			if os.path.islink(full_path) and not self.followsyms:
 				continue
 
-			# for directories yield the directory name and then yield from recursively
-			if os.path.isdir(full_path) or os.path.islink(full_path):
+			if self.maxentries != -1 and shown >= self.maxentries:
+				unshown = 1 + self._skipped(parent_path, entries, level, links=False, logical_parent=logical_parent)
+				self._truncate(parent_path, 'maxentries', unshown)
+				return
+			if self.stopped is not None or self._budget(full_path) is not None:
+				self._stop(parent_path, shown, 1 + self._skipped(parent_path, entries, level, links=False, logical_parent=logical_parent))
+				return
+			shown += 1
+			self.nodes += 1
 
-				if os.path.islink(full_path):
-					yield ("%s%s[%s -> %s]" % (prefix, idc, self._color(sub_path, level), os.path.realpath(full_path)))
-					full_path = os.path.realpath(full_path)
-					print("parent_path: %s" % (parent_path))
-					print("full_path: %s" % (full_path))
-				else:
-					yield ("%s%s[%s]" % (prefix, idc, self._color(sub_path, level)))
+			if os.path.islink(full_path) and os.path.isdir(full_path):
+				full_path = os.path.realpath(full_path)
+
+			if os.path.isfile(full_path):
+				data = self.pathread(full_path)
+				self.nbytes += self._size(data)
+				yield (full_path, data)
 
-				tmp_prefix = (prefix + "    ", prefix + "│   ")[len(file_list) > 1 and idx != len(file_list) - 1]
-				# paths = os.listdir(full_path)
-				paths = [d.name for d in sorted(os.scandir(full_path), key=lambda dirent: dirent.inode())]
-				yield from self._tree(full_path, paths, tmp_prefix, level + 1)
-				# yield from self._tree(full_path, os.listdir(full_path), tmp_prefix, level + 1)
+			elif os.path.isdir(full_path):
+				# no ordering is needed so stream the directory as it is read
+				try:
+					yield from self._snapshot(full_path, _scandir(full_path), level + 1, logical_path)
+				except OSError as e:
+					self._error(full_path, e)
 
 
 def _main2(paths, maxlevel=-1, pinclude=[], pexclude=[], include=[], exclude=[], bold=[],
-		ordinary=False, nobold=False, sort=True, followsyms=False):
+		ordinary=False, nobold=False, sort=True, followsyms=False, order=None, **limits):
 	#print("paths: %s" % (paths), file=sys.stderr)
 	#print("include: %s" % (include), file=sys.stderr)
 	#print("exclude: %s" % (exclude), file=sys.stderr)
@@ -426,7 +675,7 @@ def _main2(paths, maxlevel=-1, pinclude=[], pexclude=[], include=[], exclude=[],
 		sysfs = sysfstree(p, maxlevel=maxlevel,
 				pinclude=pinclude, pexclude=pexclude,
 				include=include, exclude=exclude,
-				bold=bold, ordinary=ordinary, nobold=nobold, sort=sort, followsyms=followsyms)
+				bold=bold, ordinary=ordinary, nobold=nobold, sort=sort, followsyms=followsyms, order=order, **limits)
 		try:
 			for l in sysfs._tree(p, os.listdir(p), "", -1):
 				print("%s" % (l), file=sys.stdout)
@@ -486,6 +735,11 @@ def main():
 	parser.add_argument("--usb-gadget-udc", "--gadget-udc", help="/sys/kernel/config/usb_gadget/*/udc", action='store_true')
 
 	parser.add_argument("-m", "--maxlevel", help="max level", type=int, default=-1)
+	parser.add_argument("--order", help="directory order", choices=ORDERS, default=None)
+	parser.add_argument("--maxentries", help="max entries shown per directory", type=int, default=-1)
+	parser.add_argument("--maxnodes", help="max entries shown per walk", type=int, default=-1)
+	parser.add_argument("--maxbytes", help="max bytes of file data read per walk", type=int, default=-1)
+	parser.add_argument("--maxtime", help="max seconds per walk", type=float, default=-1)
 	parser.add_argument("paths", metavar='Path', type=str, nargs=argparse.REMAINDER, help="pathname", default=[])
 
 	args = parser.parse_args()
@@ -539,7 +793,8 @@ def main():
 		_main2([path], maxlevel=args.maxlevel,
 				include=args.include_list, exclude=args.exclude_list,
 				pinclude=args.pinclude, pexclude=args.pexclude,
-				bold=args.bold_list, ordinary=args.ordinary, nobold=args.nobold)
+				bold=args.bold_list, ordinary=args.ordinary, nobold=args.nobold, order=args.order,
+				maxentries=args.maxentries, maxnodes=args.maxnodes, maxbytes=args.maxbytes, maxtime=args.maxtime)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+
+# maketree
+# Return a function that creates files below tmp_path and returns its path, files
+# is a dict of {name: data} or a list of names which all contain 1, names may
+# contain directories
+#
+@pytest.fixture
+def maketree(tmp_path):
+	def make(files):
+		if type(files) is list:
+			files = dict((name, '1') for name in files)
+		for name, data in files.items():
+			path = tmp_path / name
+			path.parent.mkdir(parents=True, exist_ok=True)
+			path.write_text(data + '\n')
+		return str(tmp_path)
+	return make
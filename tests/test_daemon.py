@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import tempfile
+import threading
+
+import pytest
+
+import sysfstree.daemon
+from sysfstree.daemon import sysfsdaemon
+from sysfstree.client import sysfsclient
+
+
+@pytest.fixture
+def tree(maketree):
+	return maketree({
+		'g1/idVendor': '0x1d6b',
+		'g1/UDC': 'fe980000.usb',
+		'g1/strings/manufacturer': 'Foo Inc.',
+	})
+
+
+@pytest.fixture
+def daemon():
+	sockdir = tempfile.mkdtemp()
+	sockpath = os.path.join(sockdir, 'sysfstree.sock')
+	d = sysfsdaemon(sockpath)
+	t = threading.Thread(target=d.serve_forever)
+	t.daemon = True
+	t.start()
+	for i in range(200):
+		if os.path.exists(sockpath):
+			break
+		time.sleep(0.01)
+	yield d
+	d.shutdown()
+	t.join()
+	os.rmdir(sockdir)
+
+
+def test_ops(daemon, tree):
+	client = sysfsclient(daemon.sockpath)
+	assert client.request({'op': 'ping'}) == 'pong'
+
+	lines = client.tree([tree], ordinary=True, nobold=True)
+	assert lines[0] == '[%s]' % (tree)
+	assert '    ├──idVendor: 0x1d6b' in lines
+	assert '    │   ├──manufacturer: Foo Inc.' in lines
+
+	snapshot = client.snapshot([tree], ordinary=True)
+	assert snapshot['truncated'] == []
+	assert snapshot['files'] == {
+		os.path.join(tree, 'g1', 'idVendor'): ['0x1d6b'],
+		os.path.join(tree, 'g1', 'UDC'): ['fe980000.usb'],
+		os.path.join(tree, 'g1', 'strings', 'manufacturer'): ['Foo Inc.'],
+	}
+
+	assert client.query(os.path.join(tree, 'g1', 'UDC'), ordinary=True) == ['fe980000.usb']
+	assert client.query(os.path.join(tree, 'g1', 'idVendor'), ordinary=True, decode=True) == 0x1d6b
+	client.close()
+
+
+def test_poll(daemon, tree):
+	count = os.path.join(tree, 'g1', 'count')
+	binary = os.path.join(tree, 'g1', 'descriptor')
+	with open(count, 'w') as f:
+		f.write('10\n')
+	with open(binary, 'wb') as f:
+		f.write(b'\x01\x04\x80')
+	client = sysfsclient(daemon.sockpath)
+	result = client.poll([tree], ordinary=True)
+	assert result['values'][count] == 10
+	assert result['values'][os.path.join(tree, 'g1', 'idVendor')] == 0x1d6b
+	# binary data is only converted to hex for the response, it is not decoded as an int
+	assert result['values'][binary] == '010480'
+	assert result['deltas'] == {}
+	with open(count, 'w') as f:
+		f.write('13\n')
+	result = client.poll([tree], ordinary=True)
+	assert result['values'] == {}
+	assert result['deltas'] == {count: 3}
+	assert len(daemon.series) == 1
+	assert len(list(daemon.series.values())[0].times) == 2
+	assert client.drop([tree], ordinary=True) is True
+	assert client.drop([tree], ordinary=True) is False
+	assert daemon.series == {}
+	client.close()
+
+
+def test_errors(daemon, tree):
+	client = sysfsclient(daemon.sockpath)
+	with pytest.raises(RuntimeError, match='unknown op'):
+		client.request({'op': 'bogus'})
+	with pytest.raises(RuntimeError, match='order must be one of'):
+		client.tree([tree], order='bogus')
+	with pytest.raises(RuntimeError, match='mutually exclusive'):
+		client.tree([tree], include=[['g1']], pinclude=['g1'])
+	with pytest.raises(RuntimeError, match='walks must be a list of objects'):
+		client.tree([tree], walks=['g1'])
+	assert client.request({'op': 'ping'}) == 'pong'
+	client.close()
+
+
+def test_partial_walks(daemon, tree):
+	client = sysfsclient(daemon.sockpath)
+	lines = client.tree([tree], ordinary=True, nobold=True, walks=[{'include': [['g1'], ['UDC']]}])
+	assert lines == ['[%s]' % (tree), '└──[g1]', '    ├──UDC: fe980000.usb']
+	lines = client.tree([tree], ordinary=True, nobold=True, include=None, exclude=None)
+	assert lines == client.tree([tree], ordinary=True, nobold=True)
+	client.close()
+
+
+def test_coalesce(daemon, tree):
+	calls = []
+	run = daemon._run
+
+	def slowrun(request):
+		calls.append(request)
+		time.sleep(0.5)
+		return run(request)
+
+	daemon._run = slowrun
+
+	results = []
+
+	def request():
+		client = sysfsclient(daemon.sockpath)
+		results.append(client.tree([tree], ordinary=True))
+		client.close()
+
+	threads = [threading.Thread(target=request) for i in range(2)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+
+	assert len(calls) == 1
+	assert len(results) == 2 and results[0] == results[1]
+
+
+def test_walkers_bounded(tree, monkeypatch):
+	monkeypatch.setattr(sysfstree.daemon, 'MAXWALKERS', 2)
+	d = sysfsdaemon(None)
+	for path in ['UDC', 'idVendor', os.path.join('strings', 'manufacturer')]:
+		assert d.handle({'op': 'query', 'path': os.path.join(tree, 'g1', path)})['ok']
+	assert len(d.walkers) == 0
+
+	for maxnodes in [1, 2, 3, 1]:
+		assert d.handle({'op': 'tree', 'paths': [tree], 'maxnodes': maxnodes})['ok']
+	assert len(d.walkers) == 2
+	assert [json.loads(key)[1]['maxnodes'] for key in d.walkers] == [3, 1]
+
+
+def test_socket_in_use(daemon, tmp_path):
+	with pytest.raises(OSError, match='in use'):
+		sysfsdaemon(daemon.sockpath).serve_forever()
+
+	path = tmp_path / 'important.txt'
+	path.write_text('keep')
+	with pytest.raises(OSError, match='not a socket'):
+		sysfsdaemon(str(path)).serve_forever()
+	assert path.read_text() == 'keep'
@@ -0,0 +1,46 @@
+import random
+
+from sysfstree.decode import sysfsseries
+
+
+def test_series_maxrows():
+	series = sysfsseries(maxrows=2)
+	rows = []
+	for i in range(5):
+		snapshot = {'count': [str(i)], 'state': ['s%d' % (i)]}
+		if i == 0:
+			snapshot['once'] = ['1']
+		rows.append(series.append(snapshot, when=i))
+	assert rows == [0, 1, 2, 3, 4]
+	assert list(series.times) == [3, 4]
+	assert sorted(series.columns) == ['count', 'state']
+	assert series.columns['count'].values() == [3, 4]
+	assert series.columns['state'].labels == ['s3', 's4']
+	assert series.lastvalues() == {'state': 's4'}
+	assert series.lastdeltas() == {'count': 1}
+
+
+def test_enum_labels_compacted_lazily():
+	series = sysfsseries(maxrows=4)
+	for i, state in enumerate(['a', 'b', 'c', 'd', 'a', 'e']):
+		series.append({'state': [state]}, when=i)
+	column = series.columns['state']
+	# b is no longer used but the codes are kept until most labels are unused
+	assert column.labels == ['a', 'b', 'c', 'd', 'e']
+	assert column.values() == ['c', 'd', 'a', 'e']
+	for i, state in enumerate(['e', 'e', 'e']):
+		series.append({'state': [state]}, when=6 + i)
+	assert column.labels == ['a', 'e']
+	assert column.values() == ['e', 'e', 'e', 'e']
+
+
+def test_enum_trim_matches_values():
+	random.seed(1)
+	series = sysfsseries(maxrows=8)
+	states = []
+	for i in range(500):
+		states.append('s%d' % (random.randrange(12) if i < 250 else random.randrange(3)))
+		series.append({'state': [states[-1]]}, when=i)
+		column = series.columns['state']
+		assert column.values() == states[-8:]
+		assert len(column.labels) - column.unused == len(set(states[-8:]))
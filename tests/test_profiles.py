@@ -0,0 +1,131 @@
+import os
+
+import pytest
+
+from sysfstree.sysfstree import sysfstree
+from sysfstree.profiles import plan, mergedtree
+
+
+# the usb_gadget walks from the soc-udc-state profile, with the root written
+# three different ways
+#
+WALKS = [
+	{'include': [[], ['UDC', 'id*', 'functions', 'strings']],
+		'bold': [['*'], ['UDC', 'id*'], ['*.*'], ['manufacturer', 'product']]},
+	{'include': [[], ['configs']]},
+	{'include': [['g2']]},
+]
+
+
+@pytest.fixture
+def tree(maketree):
+	return maketree({
+		'g1/UDC': 'fe980000.usb',
+		'g1/idVendor': '0x1d6b',
+		'g1/idProduct': '0x0104',
+		'g1/bcdUSB': '0x0200',
+		'g1/functions/acm.usb0/port_num': '0',
+		'g1/strings/0x409/manufacturer': 'Foo Inc.',
+		'g1/configs/c.1/MaxPower': '2',
+		'g1/os_desc/use': '0',
+		'g2/UDC': '',
+		'g2/configs/c.1/MaxPower': '250',
+	})
+
+
+@pytest.fixture
+def profiles(tree):
+	return {
+		'state': {'walks': [dict(WALKS[0], root=tree), dict(WALKS[1], root=tree + '/')]},
+		'g2': {'walks': [dict(WALKS[2], root=os.path.dirname(tree) + '//' + os.path.basename(tree))]},
+		'again': {'walks': [dict(WALKS[1], root=tree)]},
+	}
+
+
+# _nodes
+# Return the set of paths shown in _tree() output
+#
+def _nodes(root, lines):
+	nodes = set()
+	parents = [root]
+	for line in lines[1:]:
+		if '──' not in line:
+			continue
+		level = line.index('──') // 4
+		name = line[line.index('──') + 2:]
+		if name.startswith('['):
+			name = name[1:name.index(']')]
+		else:
+			name = name.split(':')[0]
+		path = os.path.join(parents[level], name)
+		parents[level + 1:] = [path]
+		nodes.add(path)
+	return nodes
+
+
+def test_plan_one_walk_per_root(tree, profiles):
+	roots = plan(profiles, ['state', 'g2', 'again'])
+	assert [root for root, walks in roots] == [tree]
+	(root, walks) = roots[0]
+	assert len(walks) == 3
+	assert walks[0]['include'] == WALKS[0]['include']
+	assert walks[1]['include'] == WALKS[1]['include']
+
+
+def test_plan_include_substitution(tree):
+	roots = plan({'p': {'walks': [{'root': tree, 'include': [['g1'], '@include']}]}}, ['p'], include=['UDC'])
+	assert roots[0][1][0]['include'] == [['g1'], ['UDC']]
+
+
+def test_mergedtree_matches_separate_walks(tree, profiles):
+	(root, walks) = plan(profiles, ['state', 'g2'])[0]
+
+	separate = set()
+	files = set()
+	for walk in walks:
+		sysfs = sysfstree(root, -1, nobold=True, ordinary=True, **walk)
+		separate |= _nodes(root, list(sysfs._tree(root, os.listdir(root), "", -1)))
+		files |= set(path for path, data in sysfs._snapshot(root, os.listdir(root), -1))
+
+	merged = mergedtree(root, walks, -1, nobold=True, ordinary=True)
+	assert _nodes(root, list(merged._tree(root, os.listdir(root), "", -1))) == separate
+	assert set(path for path, data in merged._snapshot(root, os.listdir(root), -1)) == files
+
+	assert os.path.join(root, 'g1', 'os_desc') not in separate
+	assert os.path.join(root, 'g2', 'configs', 'c.1', 'MaxPower') in separate
+
+
+def test_mergedtree_reads_each_directory_once(tree, profiles):
+	(root, walks) = plan(profiles, ['state', 'g2'])[0]
+	merged = mergedtree(root, walks, -1, nobold=True, ordinary=True)
+
+	ordered = []
+	order = merged._order
+
+	def counted(path, names=None):
+		ordered.append(path)
+		return order(path, names)
+
+	merged._order = counted
+	list(merged._tree(root, os.listdir(root), "", -1))
+	assert len(ordered) == len(set(ordered))
+	assert root in ordered
+
+
+def test_mergedtree_follows_symlinks_outside_root(tmp_path):
+	(tmp_path / 'outside' / 'sub').mkdir(parents=True)
+	(tmp_path / 'outside' / 'sub' / 'f').write_text('1\n')
+	(tmp_path / 'outside' / 'other').write_text('2\n')
+	(tmp_path / 'root').mkdir()
+	(tmp_path / 'root' / 'ln').symlink_to('../outside')
+	root = str(tmp_path / 'root')
+	walk = {'include': [['ln', 'd'], ['sub', 'f'], ['f']], 'exclude': []}
+
+	sysfs = sysfstree(root, -1, nobold=True, ordinary=True, followsyms=True, **walk)
+	merged = mergedtree(root, [walk], -1, nobold=True, ordinary=True, followsyms=True)
+	lines = list(merged._tree(root, os.listdir(root), "", -1))
+	assert lines == list(sysfs._tree(root, os.listdir(root), "", -1))
+	assert any(line.endswith('f: 1') for line in lines)
+	assert not any('other' in line for line in lines)
+	files = [path for path, data in merged._snapshot(root, os.listdir(root), -1)]
+	assert files == [str(tmp_path / 'outside' / 'sub' / 'f')]
@@ -0,0 +1,141 @@
+import os
+import types
+import importlib
+
+import pytest
+
+from sysfstree.sysfstree import sysfstree, _natural
+
+
+@pytest.fixture
+def tree(maketree):
+	return maketree(['top', 'g0/a/z', 'g0/a/b/x', 'g0/a/b/y', 'g1/w'])
+
+
+def _walk(root, **limits):
+	sysfs = sysfstree(root, -1, include=[], exclude=[], ordinary=True, order='name', **limits)
+	lines = list(sysfs._tree(root, os.listdir(root), "", -1))
+	return (sysfs, lines)
+
+
+def _skipped(sysfs):
+	return dict((os.path.basename(t['path']), (t['reason'], t['skipped'])) for t in sysfs.truncated)
+
+
+def test_maxnodes_reports_each_level(tree):
+	(sysfs, lines) = _walk(tree, maxnodes=5)
+	assert _skipped(sysfs) == {'b': ('maxnodes', 2), os.path.basename(tree): ('maxnodes', 1)}
+	assert lines[-1] == "└──[truncated: 1 more entries, maxnodes 5 reached]"
+	assert not any('w' in l for l in lines)
+
+
+def test_maxnodes_keeps_maxentries(tree):
+	(sysfs, lines) = _walk(tree, maxnodes=2, maxentries=2)
+	reasons = [(os.path.basename(t['path']), t['reason'], t['skipped']) for t in sysfs.truncated]
+	assert (os.path.basename(tree), 'maxentries', 1) in reasons
+	assert lines[-1] == "└──[truncated: 1 more entries, maxentries 2 reached]"
+
+
+def test_snapshot_maxnodes_reports_each_level(tree):
+	sysfs = sysfstree(tree, -1, include=[], exclude=[], order='name', maxnodes=2)
+	files = [p for p, d in sysfs._snapshot(tree, ['top', 'g0', 'g1'], -1)]
+	assert files == [os.path.join(tree, 'top')]
+	assert _skipped(sysfs) == {'g0': ('maxnodes', 1), os.path.basename(tree): ('maxnodes', 1)}
+
+
+
+def test_snapshot_records_unreadable_directories(tree, monkeypatch):
+	module = importlib.import_module('sysfstree.sysfstree')
+	scandir = module._scandir
+
+	def denied(path):
+		if path == os.path.join(tree, 'g0', 'a'):
+			raise PermissionError(13, 'Permission denied', path)
+		return scandir(path)
+
+	monkeypatch.setattr(module, '_scandir', denied)
+	sysfs = sysfstree(tree, -1, include=[], exclude=[], order='name')
+	files = set(p for p, d in sysfs._snapshot(tree, os.listdir(tree), -1))
+	assert files == set([os.path.join(tree, 'top'), os.path.join(tree, 'g1', 'w')])
+	assert len(sysfs.truncated) == 1
+	assert sysfs.truncated[0]['path'] == os.path.join(tree, 'g0', 'a')
+	assert sysfs.truncated[0]['reason'] == 'error'
+	assert sysfs.truncated[0]['error'].startswith('PermissionError')
+
+
+# nested cpuN directories so that natural and name order differ below the root
+#
+@pytest.fixture
+def cpus(maketree):
+	return maketree([
+		'cpu/possible', 'cpu/Online', 'cpu/cpu1/online',
+		'cpu/cpu2/cache/index1/level', 'cpu/cpu2/cache/index2/level', 'cpu/cpu2/cache/index10/level',
+		'cpu/cpu10/cache/index2/level', 'cpu/cpu10/cache/index10/level',
+	])
+
+
+# _children
+# Return {path: [names]} with the names shown for each directory in _tree() output
+#
+def _children(root, lines):
+	children = {root: []}
+	parents = [root]
+	for line in lines[1:]:
+		level = line.index('──') // 4
+		name = line[line.index('──') + 2:]
+		isdir = name.startswith('[')
+		name = name[1:-1] if isdir else name.split(':')[0]
+		children[parents[level]].append(name)
+		if isdir:
+			path = os.path.join(parents[level], name)
+			parents[level + 1:] = [path]
+			children[path] = []
+	return children
+
+
+# _expected
+# Return {path: [names]} for every directory below root with the names ordered by
+# key, files are shown before directories
+#
+def _expected(root, key):
+	expected = {}
+	for path, dirs, files in os.walk(root):
+		names = key(path, os.listdir(path))
+		expected[path] = [n for n in names if n in files] + [n for n in names if n in dirs]
+	return expected
+
+
+def _ordered(root, **kwargs):
+	sysfs = sysfstree(root, -1, include=[], exclude=[], ordinary=True, nobold=True, **kwargs)
+	return (sysfs, _children(root, list(sysfs._tree(root, os.listdir(root), "", -1))))
+
+
+def test_order_natural(cpus):
+	(sysfs, children) = _ordered(cpus, order='natural')
+	cpu = os.path.join(cpus, 'cpu')
+	assert children[cpu] == ['Online', 'possible', 'cpu1', 'cpu2', 'cpu10']
+	assert children[os.path.join(cpu, 'cpu2', 'cache')] == ['index1', 'index2', 'index10']
+	assert children == _expected(cpus, lambda path, names: sorted(names, key=_natural))
+
+
+def test_order_name(cpus):
+	(sysfs, children) = _ordered(cpus, order='name')
+	cpu = os.path.join(cpus, 'cpu')
+	assert children[cpu] == ['Online', 'possible', 'cpu1', 'cpu10', 'cpu2']
+	assert children[os.path.join(cpu, 'cpu2', 'cache')] == ['index1', 'index10', 'index2']
+	assert children == _expected(cpus, lambda path, names: sorted(names, key=str.casefold))
+	assert children == _ordered(cpus)[1]
+
+
+def test_order_inode(cpus):
+	(sysfs, children) = _ordered(cpus, order='inode')
+	assert children == _expected(cpus,
+		lambda path, names: sorted(names, key=lambda name: os.lstat(os.path.join(path, name)).st_ino))
+
+
+def test_order_native(cpus):
+	(sysfs, children) = _ordered(cpus, sort=False)
+	assert sysfs.order == 'native'
+	assert children == _expected(cpus, lambda path, names: names)
+	# below the root directories are streamed as they are read, not sorted
+	assert isinstance(sysfs._order(os.path.join(cpus, 'cpu')), types.GeneratorType)